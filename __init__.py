@@ -13,14 +13,93 @@ bl_info = {
 }
 
 import os, sys
-import bpy, bmesh
+from array import array
+import bpy
 # ImportHelper is a helper class, defines filename and invoke() function which calls the file selector
 from bpy_extras.io_utils import ImportHelper
 
-import xml.etree.cElementTree as etree
+import xml.etree.ElementTree as etree
+import numpy
+# lxml is optional; it may be faster or slower than the standard library parser
+# depending on the GPX file, so the choice is left to the user
+try:
+    import lxml.etree as lxmlEtree
+    _hasLxml = True
+except ImportError:
+    _hasLxml = False
+
+from .transverse_mercator import TransverseMercator
 
 
 _isBlender280 = bpy.app.version[1] >= 80
+
+# The API differences between Blender 2.8x and 2.7x are resolved once here
+if _isBlender280:
+    _importMenuName = "TOPBAR_MT_file_import"
+    
+    def _getAddons(context):
+        return context.preferences.addons
+    
+    def _getActiveObject(context):
+        return context.view_layer.objects.active
+    
+    def _setActiveObject(context, obj):
+        context.view_layer.objects.active = obj
+    
+    def _getFirstObject(context):
+        return context.scene.collection.objects[0]
+    
+    def _linkObject(obj):
+        bpy.context.scene.collection.objects.link(obj)
+    
+    def _selectObject(obj):
+        obj.select_set(True)
+    
+    def _hideObject(obj):
+        obj.hide_viewport = True
+        obj.hide_select = True
+        obj.hide_render = True
+else:
+    _importMenuName = "INFO_MT_file_import"
+    
+    def _getAddons(context):
+        return context.user_preferences.addons
+    
+    def _getActiveObject(context):
+        return context.scene.objects.active
+    
+    def _setActiveObject(context, obj):
+        context.scene.objects.active = obj
+    
+    def _getFirstObject(context):
+        return context.scene.objects[0]
+    
+    def _linkObject(obj):
+        bpy.context.scene.objects.link(obj)
+    
+    def _selectObject(obj):
+        obj.select = True
+        bpy.context.scene.update()
+    
+    def _hideObject(obj):
+        obj.hide = True
+        obj.hide_select = True
+        obj.hide_render = True
+
+# Each tag may have the form {http://www.topografix.com/GPX/1/1}tag,
+# so the tags are matched against the sets of fully qualified names
+_namespaces = (
+    "{http://www.topografix.com/GPX/1/1}",
+    "{http://www.topografix.com/GPX/1/0}",
+    ""
+)
+_trksegTags = frozenset(ns + "trkseg" for ns in _namespaces)
+_trkptTags = frozenset(ns + "trkpt" for ns in _namespaces)
+_eleTags = frozenset(ns + "ele" for ns in _namespaces)
+
+# the buffer size for reading a GPX file
+_readBufferSize = 1 << 20
+
 _curveBevelObjectName = "gpx_bevel"
 
 _bevelCurves = {
@@ -32,6 +111,114 @@ _bevelCurves = {
 }
 
 
+def _setSplinePoints(spline, points):
+    """
+    Set all points of the newly created <spline> at once.
+    <points> is a non-empty sequence of (x,y,z)
+    """
+    # a new spline already has one point
+    spline.points.add( len(points)-1 )
+    co = numpy.ones((len(points), 4), dtype=numpy.float32)
+    co[:,:3] = points
+    spline.points.foreach_set("co", co.ravel())
+
+
+def _getBevelObject(bevelCurveId):
+    """
+    Get the Blender object serving as a bevel object for the imported curves.
+    The object is created on the first import and reused afterwards
+    """
+    bevelObj = bpy.data.objects.get(_curveBevelObjectName)
+    if not (bevelObj and bevelObj.type == 'CURVE'):
+        # create a Blender object of the type 'CURVE' to surve as a bevel object
+        bevelCurve = bpy.data.curves.new(_curveBevelObjectName, 'CURVE')
+        bevelCurveData, isBevelCurveClosed = _bevelCurves[bevelCurveId]
+        
+        spline = bevelCurve.splines.new('POLY')
+        _setSplinePoints(spline, bevelCurveData)
+        
+        if isBevelCurveClosed:
+            spline.use_cyclic_u = True
+        
+        bevelObj = bpy.data.objects.new(_curveBevelObjectName, bevelCurve)
+        
+        _hideObject(bevelObj)
+        _linkObject(bevelObj)
+    return bevelObj
+
+
+def _getTrackElementsEtree(f):
+    """
+    A generator of <trkpt> and <trkseg> elements streamed with <iterparse(..)>.
+    An element is released right after it has been processed, so
+    the memory footprint doesn't grow with the number of track points
+    """
+    root = None
+    trkseg = None
+    # the depth of the current element, the root element <gpx> has the depth 1
+    depth = 0
+    # the children of <trkpt> (e.g. <ele>) must be kept until the <trkpt> is processed
+    inTrkpt = False
+    for event, e in etree.iterparse(f, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if root is None:
+                root = e
+            elif e.tag in _trksegTags:
+                trkseg = e
+            elif e.tag in _trkptTags:
+                inTrkpt = True
+            continue
+        depth -= 1
+        if e.tag in _trkptTags:
+            inTrkpt = False
+            yield e
+            # detach the processed <trkpt> from its <trkseg>
+            if trkseg is not None:
+                del trkseg[:]
+        elif e.tag in _trksegTags:
+            yield e
+            trkseg = None
+        elif not inTrkpt:
+            # e.g. <wpt>, <rte> or <metadata>
+            e.clear()
+        if depth == 1:
+            # detach the processed child of <gpx>
+            del root[:]
+
+
+def _getTrackElementsLxml(f):
+    """
+    A generator of <trkpt> and <trkseg> elements located with lxml XPath.
+    The elements come in the same order as the <end> events of <iterparse(..)>:
+    the points of a segment are followed by the segment itself.
+    Unlike <_getTrackElementsEtree(..)>, the whole document is held in memory
+    """
+    # the same namespaces as for <_getTrackElementsEtree(..)> are accepted,
+    # also if they are bound to a prefix in the document
+    namespaces = {}
+    prefixes = []
+    for i, ns in enumerate(_namespaces):
+        if ns:
+            namespaces["g%s" % i] = ns[1:-1]
+            prefixes.append("g%s:" % i)
+        else:
+            prefixes.append("")
+    trkptPath = lxmlEtree.XPath(
+        " | ".join("./%strkpt" % prefix for prefix in prefixes),
+        namespaces=namespaces
+    )
+    trksegPath = lxmlEtree.XPath(
+        " | ".join("//%strkseg" % prefix for prefix in prefixes),
+        namespaces=namespaces
+    )
+    # entities aren't resolved in a user supplied file
+    root = lxmlEtree.parse(f, lxmlEtree.XMLParser(resolve_entities=False)).getroot()
+    for trkseg in trksegPath(root):
+        yield from trkptPath(trkseg)
+        yield trkseg
+
+
 class ImportGpx(bpy.types.Operator, ImportHelper):
     """Import a file in the GPX format (.gpx)"""
     bl_idname = "import_scene.gpx"  # important since its how bpy.ops.import_scene.gpx is constructed
@@ -58,6 +245,12 @@ class ImportGpx(bpy.types.Operator, ImportHelper):
         default=True,
     )
     
+    removeDuplicates = bpy.props.BoolProperty(
+        name="Remove duplicate points",
+        description="Skip a track point if it has the same coordinates as the previous one",
+        default=True,
+    )
+    
     importType = bpy.props.EnumProperty(
         name = "Import as curve or mesh",
         items = (
@@ -68,28 +261,37 @@ class ImportGpx(bpy.types.Operator, ImportHelper):
         default = "curve"
     )
     
+    xmlParser = bpy.props.EnumProperty(
+        name = "XML parser",
+        items = (
+            ("etree", "xml.etree", "XML parser from the Python standard library"),
+            ("lxml", "lxml", "lxml XML parser, track points are located with XPath. The whole file is held in memory")
+        ),
+        description = "XML parser used to read the GPX file. lxml is used only if it is installed",
+        default = "etree"
+    )
+    
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "useElevation")
         layout.prop(self, "ignoreGeoreferencing")
+        layout.prop(self, "removeDuplicates")
+        if _hasLxml:
+            layout.prop(self, "xmlParser")
         if self.bpyproj:
             self.bpyproj.draw(context, layout)
     
     def invoke(self, context, event):
         # check if <bpyproj> is activated and is available in sys.modules
-        self.bpyproj = "bpyproj" in (context.preferences.addons if _isBlender280 else context.user_preferences.addons) and sys.modules.get("bpyproj")
+        self.bpyproj = "bpyproj" in _getAddons(context) and sys.modules.get("bpyproj")
         return super().invoke(context, event)
 
     def execute(self, context):
         # setting active object if there is no active object
         if context.mode != "OBJECT":
             # if there is no object in the scene, only "OBJECT" mode is provided
-            if _isBlender280:
-                if not context.view_layer.objects.active:
-                    context.view_layer.objects.active = context.scene.collection.objects[0]
-            else:
-                if not context.scene.objects.active:
-                    context.scene.objects.active = context.scene.objects[0]
+            if not _getActiveObject(context):
+                _setActiveObject(context, _getFirstObject(context))
             bpy.ops.object.mode_set(mode="OBJECT")
         
         bpy.ops.object.select_all(action="DESELECT")
@@ -101,87 +303,115 @@ class ImportGpx(bpy.types.Operator, ImportHelper):
         else:
             obj = self.makeMesh(context, name)
         
-        if _isBlender280:
-            bpy.context.scene.collection.objects.link(obj)
-        else:
-            bpy.context.scene.objects.link(obj)
-        
-        # remove double vertices
-        if _isBlender280:
-            context.view_layer.objects.active = obj
-        else:
-            context.scene.objects.active = obj
+        _linkObject(obj)
         
-        if _isBlender280:
-            obj.select_set(True)
-        else:
-            obj.select = True
-            bpy.context.scene.update()
+        # make the imported object active and selected
+        _setActiveObject(context, obj)
+        _selectObject(obj)
         
         return {"FINISHED"}
 
     def read_gpx_file(self, context):
-        # a list of track segments (trkseg)
+        # a list of track segments (trkseg);
+        # each segment is a tuple of NumPy arrays (x, y, z) in the Blender system of reference,
+        # z is set to zero if <self.useElevation> is False
         segments = []
-
-        minLat = 90
-        maxLat = -90
-        minLon = 180
-        maxLon = -180
         
-        gpx = etree.parse(self.filepath).getroot()
+        # If the scene is already georeferenced, the projection is known before parsing,
+        # so each segment is projected right after it has been parsed while its data is still in the cache.
+        # Otherwise the projection center is defined by the track extent, and
+        # the segments are projected after the whole file has been parsed
+        projection = self.getProjection(context) if self.isGeoreferenced(context) else None
+
+        useElevation = self.useElevation
+        removeDuplicates = self.removeDuplicates
+        # flat buffers of C doubles are used instead of lists of Python floats
+        lats = array('d')
+        lons = array('d')
+        eles = array('d')
         
-        for e1 in gpx: # e stands for element
-            # Each tag may have the form {http://www.topografix.com/GPX/1/1}tag
-            # That's whay we skip curly brackets
-            if e1.tag[e1.tag.find("}")+1:] == "trk":
-                for e2 in e1:
-                    if e2.tag[e2.tag.find("}")+1:] == "trkseg":
-                        segment = []
-                        for e3 in e2:
-                            if e3.tag[e3.tag.find("}")+1:] == "trkpt":
-                                lat = float(e3.attrib["lat"])
-                                lon = float(e3.attrib["lon"])
-                                # calculate track extent
-                                if lat<minLat: minLat = lat
-                                elif lat>maxLat: maxLat = lat
-                                if lon<minLon: minLon = lon
-                                elif lon>maxLon: maxLon = lon
-                                # check if <trkpt> has <ele>
-                                ele = None
-                                for e4 in e3:
-                                    if e4.tag[e4.tag.find("}")+1:] == "ele":
-                                        ele = e4
-                                        break
-                                point = (lat, lon, float(ele.text)) if self.useElevation and ele is not None else (lat, lon)
-                                segment.append(point)
+        with open(self.filepath, "rb", buffering=_readBufferSize) as f:
+            if _hasLxml and self.xmlParser == "lxml":
+                elements = _getTrackElementsLxml(f)
+            else:
+                elements = _getTrackElementsEtree(f)
+            for e in elements:
+                if e.tag in _trkptTags:
+                    lat = e.get("lat")
+                    lon = e.get("lon")
+                    # skip a malformed <trkpt> without coordinates
+                    if lat is None or lon is None:
+                        continue
+                    lat = float(lat)
+                    lon = float(lon)
+                    if useElevation:
+                        # check if <trkpt> has <ele>
+                        ele = next((e1 for e1 in e if e1.tag in _eleTags), None)
+                        ele = 0. if ele is None else float(ele.text)
+                    # skip a point identical to the previous one (e.g. during a rest)
+                    if removeDuplicates and lats and lat == lats[-1] and lon == lons[-1] and \
+                            (not useElevation or ele == eles[-1]):
+                        continue
+                    lats.append(lat)
+                    lons.append(lon)
+                    if useElevation:
+                        eles.append(ele)
+                elif e.tag in _trksegTags:
+                    # skip a <trkseg> without points
+                    if lats:
+                        # no copy is made, the NumPy arrays share memory with the buffers
+                        segment = (
+                            numpy.frombuffer(lats, dtype=numpy.float64),
+                            numpy.frombuffer(lons, dtype=numpy.float64),
+                            numpy.frombuffer(eles, dtype=numpy.float64) if useElevation else numpy.zeros(len(lats))
+                        )
+                        if projection is not None:
+                            segment = self.projectSegment(projection, segment)
                         segments.append(segment)
+                    lats = array('d')
+                    lons = array('d')
+                    eles = array('d')
         
-        projection = self.getProjection(context, lat = (minLat + maxLat)/2, lon = (minLon + maxLon)/2)
+        if projection is None:
+            # calculate track extent
+            if segments:
+                minLat = min(segment[0].min() for segment in segments)
+                maxLat = max(segment[0].max() for segment in segments)
+                minLon = min(segment[1].min() for segment in segments)
+                maxLon = max(segment[1].max() for segment in segments)
+            else:
+                minLat = maxLat = minLon = maxLon = 0.
+            
+            projection = self.getProjection(context, lat = float(minLat + maxLat)/2, lon = float(minLon + maxLon)/2)
+            segments = [self.projectSegment(projection, segment) for segment in segments]
         
-        return segments, projection
+        return segments
     
     def makeMesh(self, context, name):
-        self.bm = bmesh.new()
-        
-        segments, projection = self.read_gpx_file(context)
+        segments = self.read_gpx_file(context)
         
-        # create vertices and edges for the track segments
-        for segment in segments:
-            prevVertex = None
-            for point in segment:
-                v = projection.fromGeographic(point[0], point[1])
-                v = self.bm.verts.new((v[0], v[1], point[2] if self.useElevation and len(point)==3 else 0))
-                if prevVertex:
-                    self.bm.edges.new([prevVertex, v])
-                prevVertex = v
+        # coordinates of the vertices and vertex indices of the edges for the track segments;
+        # they are uploaded to the mesh at once
+        verts = []
+        edges = []
+        numVerts = 0
+        for x, y, z in segments:
+            verts.append( numpy.column_stack((x, y, z)) )
+            # the edges connect consecutive vertices of the segment
+            i = numpy.arange(numVerts, numVerts+len(x)-1, dtype=numpy.int32)
+            edges.append( numpy.column_stack((i, i+1)) )
+            numVerts += len(x)
         
         # finalize
         mesh = bpy.data.meshes.new(name)
-        self.bm.to_mesh(mesh)
-        # cleanup
-        self.bm.free()
-        self.bm = None
+        if verts:
+            verts = numpy.concatenate(verts).astype(numpy.float32)
+            edges = numpy.concatenate(edges)
+            mesh.vertices.add(len(verts))
+            mesh.vertices.foreach_set("co", verts.ravel())
+            mesh.edges.add(len(edges))
+            mesh.edges.foreach_set("vertices", edges.ravel())
+        mesh.update()
         
         return bpy.data.objects.new(name, mesh)
     
@@ -189,31 +419,28 @@ class ImportGpx(bpy.types.Operator, ImportHelper):
         curve = bpy.data.curves.new(name, 'CURVE')
         curve.dimensions = '3D'
         curve.twist_mode = 'Z_UP'
-        self.curve = curve
-        
-        segments, projection = self.read_gpx_file(context)
-        
-        for segment in segments:
-            self.createSpline()
-            for i, point in enumerate(segment):
-                if i:
-                    self.spline.points.add(1)
-                v = projection.fromGeographic(point[0], point[1])
-                self.setSplinePoint((v[0], v[1], point[2] if self.useElevation and len(point)==3 else 0))
+        curve.bevel_object = _getBevelObject("square")
         
-        # set bevel object
-        self.setCurveBevelObject("square")
-        
-        # cleanup
-        self.curve = None
-        self.spline = None
+        for x, y, z in self.read_gpx_file(context):
+            _setSplinePoints( curve.splines.new('POLY'), numpy.column_stack((x, y, z)) )
         
         return bpy.data.objects.new(name, curve)
     
-    def getProjection(self, context, lat, lon):
+    def isGeoreferenced(self, context):
+        """
+        Check if the existing georeferencing of the scene is used
+        """
+        scene = context.scene
+        return "lat" in scene and "lon" in scene and not self.ignoreGeoreferencing
+    
+    def getProjection(self, context, lat=None, lon=None):
+        """
+        Get the projection. <lat> and <lon> define its center
+        if the scene isn't georeferenced yet
+        """
         # get the coordinates of the center of the Blender system of reference
         scene = context.scene
-        if "lat" in scene and "lon" in scene and not self.ignoreGeoreferencing:
+        if self.isGeoreferenced(context):
             lat = scene["lat"]
             lon = scene["lon"]
         else:
@@ -224,51 +451,26 @@ class ImportGpx(bpy.types.Operator, ImportHelper):
         if self.bpyproj:
             projection = self.bpyproj.getProjection(lat, lon)
         if not projection:
-            from .transverse_mercator import TransverseMercator
             # fall back to the Transverse Mercator
             projection = TransverseMercator(lat=lat, lon=lon)
         return projection
     
-    def createSpline(self, curve=None):
-        if not curve:
-            curve = self.curve
-        self.spline = curve.splines.new('POLY')
-        self.pointIndex = 0
-
-    def setSplinePoint(self, point):
-        self.spline.points[self.pointIndex].co = (point[0], point[1], point[2], 1.)
-        self.pointIndex += 1
-    
-    def setCurveBevelObject(self, bevelCurveId):
-        bevelObj = bpy.data.objects.get(_curveBevelObjectName)
-        if not (bevelObj and bevelObj.type == 'CURVE'):
-            # create a Blender object of the type 'CURVE' to surve as a bevel object
-            bevelCurve = bpy.data.curves.new(_curveBevelObjectName, 'CURVE')
-            bevelCurveData, isBevelCurveClosed = _bevelCurves[bevelCurveId]
-            
-            self.createSpline(bevelCurve)
-            self.spline.points.add( len(bevelCurveData)-1 )
-            
-            for point in bevelCurveData:
-                self.setSplinePoint(point)
-            
-            if isBevelCurveClosed:
-                self.spline.use_cyclic_u = True
-            
-            bevelObj = bpy.data.objects.new(_curveBevelObjectName, bevelCurve)
-            
-            if _isBlender280:
-                bevelObj.hide_viewport = True
-                bevelObj.hide_select = True
-                bevelObj.hide_render = True
-                bpy.context.scene.collection.objects.link(bevelObj)
-            else:
-                bevelObj.hide = True
-                bevelObj.hide_select = True
-                bevelObj.hide_render = True
-                bpy.context.scene.objects.link(bevelObj)
-        
-        self.curve.bevel_object = bevelObj
+    def projectSegment(self, projection, segment):
+        """
+        Project a track segment given as a tuple of NumPy arrays (latitudes, longitudes, elevations).
+        Returns a tuple of NumPy arrays (x,y,z)
+        """
+        lats, lons, eles = segment
+        if hasattr(projection, "fromGeographicBatch"):
+            x, y = projection.fromGeographicBatch(lats, lons)
+            return x, y, eles
+        # a projection provided by <bpyproj> may not have a vectorized version
+        fromGeographic = projection.fromGeographic
+        x = numpy.empty_like(lats)
+        y = numpy.empty_like(lons)
+        for i, (lat, lon) in enumerate(zip(lats.tolist(), lons.tolist())):
+            x[i], y[i] = fromGeographic(lat, lon)
+        return x, y, eles
 
 
 # Only needed if you want to add into a dynamic menu
@@ -277,14 +479,8 @@ def menu_func_import(self, context):
 
 def register():
     bpy.utils.register_class(ImportGpx)
-    if _isBlender280:
-        bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
-    else:
-        bpy.types.INFO_MT_file_import.append(menu_func_import)
+    getattr(bpy.types, _importMenuName).append(menu_func_import)
 
 def unregister():
     bpy.utils.unregister_class(ImportGpx)
-    if _isBlender280:
-        bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
-    else:
-        bpy.types.INFO_MT_file_import.remove(menu_func_import)
+    getattr(bpy.types, _importMenuName).remove(menu_func_import)
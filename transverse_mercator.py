@@ -1,4 +1,40 @@
 import math
+import numpy
+
+# Numba is optional: if it's available, the projection math is compiled to machine code
+try:
+    from numba import njit
+    _hasNumba = True
+except ImportError:
+    _hasNumba = False
+    def njit(**kwargs):
+        return lambda f: f
+
+
+# <cache=True> is important, otherwise the compilation would happen on each start of Blender
+@njit(cache=True, fastmath=True)
+def _fromGeographic(lat, lon, lon0, lat0InRadians, kr):
+    lat = math.radians(lat)
+    lon = math.radians(lon-lon0)
+    B = math.sin(lon) * math.cos(lat)
+    x = 0.5 * kr * math.log((1+B)/(1-B))
+    y = kr * ( math.atan(math.tan(lat)/math.cos(lon)) - lat0InRadians )
+    return (x,y)
+
+
+# the function is called once per track segment, so threads (<parallel=True>) aren't used:
+# starting them would cost more than they save for a short segment
+@njit(cache=True, fastmath=True)
+def _fromGeographicBatch(lat, lon, lon0, lat0InRadians, kr):
+    n = lat.shape[0]
+    x = numpy.empty(n)
+    y = numpy.empty(n)
+    for i in range(n):
+        _x, _y = _fromGeographic(lat[i], lon[i], lon0, lat0InRadians, kr)
+        x[i] = _x
+        y[i] = _y
+    return (x,y)
+
 
 # see conversion formulas at
 # http://en.wikipedia.org/wiki/Transverse_Mercator_projection
@@ -18,11 +54,24 @@ class TransverseMercator:
         self.latInRadians = math.radians(self.lat)
 
     def fromGeographic(self, lat, lon):
-        lat = math.radians(lat)
-        lon = math.radians(lon-self.lon)
-        B = math.sin(lon) * math.cos(lat)
-        x = 0.5 * self.k * self.radius * math.log((1+B)/(1-B))
-        y = self.k * self.radius * ( math.atan(math.tan(lat)/math.cos(lon)) - self.latInRadians )
+        return _fromGeographic(lat, lon, self.lon, self.latInRadians, self.k * self.radius)
+
+    def fromGeographicBatch(self, lat, lon):
+        """
+        A vectorized version of <fromGeographic(..)>. <lat> and <lon> are NumPy arrays,
+        a tuple of NumPy arrays (x,y) is returned
+        """
+        if _hasNumba:
+            return _fromGeographicBatch(
+                numpy.ascontiguousarray(lat, dtype=numpy.float64),
+                numpy.ascontiguousarray(lon, dtype=numpy.float64),
+                float(self.lon), self.latInRadians, float(self.k * self.radius)
+            )
+        lat = numpy.radians(lat)
+        lon = numpy.radians(lon-self.lon)
+        B = numpy.sin(lon) * numpy.cos(lat)
+        x = 0.5 * self.k * self.radius * numpy.log((1+B)/(1-B))
+        y = self.k * self.radius * ( numpy.arctan(numpy.tan(lat)/numpy.cos(lon)) - self.latInRadians )
         return (x,y)
 
     def toGeographic(self, x, y):